@@ -6,110 +6,280 @@ Upload promotional coupon codes from a text file to BigCommerce store.
 
 import argparse
 import json
+import random
 import sys
-from pathlib import Path
-from typing import List, Dict, Any
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from operator import itemgetter
+from typing import List, Dict, Any, Iterator, Optional, Set
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import csv
 
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to the standard library
+    orjson = None
+
+try:
+    from tqdm import tqdm
+except ImportError:  # optional; uploads run without a progress bar
+    tqdm = None
+
+# Responses worth retrying; POSTs only on those that mean the code was not
+# created, since a resent POST after a 5xx could report a created code as a duplicate
+RETRY_GET_STATUSES = {429, 500, 502, 503, 504}
+RETRY_POST_STATUSES = {429, 503}
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
+
 RED   = "\033[31m"
 RESET = "\033[0m"
 
+# Colored "code / message" row of the upload error summary
+ERROR_ROW = (RED + "{code:<32} {message:<128}" + RESET).format
+
+
+def _dumps(data: Any) -> bytes:
+    """Serialize a request body to JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode("utf-8")
+
+
+def _loads(content: bytes) -> Any:
+    """Parse a JSON response body."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def _retry_delay(response: requests.Response, attempt: int) -> float:
+    """Seconds to wait before retrying, from Retry-After or exponential backoff."""
+    try:
+        return max(0.0, float(response.headers["Retry-After"]))
+    except (KeyError, ValueError):
+        return RETRY_BACKOFF * 2 ** attempt + random.uniform(0, RETRY_BACKOFF)
+
 
 class BigCommerceAPI:
     """BigCommerce API client for coupon operations."""
     
-    def __init__(self, store_hash: str, access_token: str):
+    def __init__(self, store_hash: str, access_token: str, concurrency: int = 8,
+                 timeout: float = 30.0, rps: float = 10.0):
         self.store_hash = store_hash
         self.access_token = access_token
+        self.concurrency = concurrency
+        self.timeout = timeout
+        
+        # Space out every API request, retries included, so concurrent workers
+        # stay under the API quota
+        self._min_interval = 1.0 / rps
+        self._next_slot = time.monotonic()
+        self._slot_lock = threading.Lock()
         self.base_url = f"https://api.bigcommerce.com/stores/{store_hash}/v3"
         self.headers = {
             "X-Auth-Token": access_token,
             "Content-Type": "application/json",
             "Accept": "application/json"
         }
+        
+        # urllib3 only retries connections that failed before a request was
+        # sent; status retries go through _request so they take rate-limit slots
+        retry = Retry(total=MAX_RETRIES, read=0, backoff_factor=RETRY_BACKOFF)
+        
+        # Reuse keep-alive connections across requests, one per upload worker
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_maxsize=concurrency, max_retries=retry)
+        self.session.mount("https://", adapter)
     
-    def get_promotions(self) -> List[Dict[str, Any]]:
-        """Get all promotions from the store."""
-        url = f"{self.base_url}/promotions?limit=250"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        return response.json().get("data", [])
+    def iter_promotions(self, page_size: int = 100) -> Iterator[Dict[str, Any]]:
+        """Lazily yield every promotion in the store, fetching pages on demand."""
+        url = f"{self.base_url}/promotions"
+        for body in self._iter_pages(url, page_size):
+            yield from body["data"]
     
     def get_promotion_by_id(self, promotion_id: int) -> Dict[str, Any]:
         """Get a specific promotion by ID."""
         url = f"{self.base_url}/promotions/{promotion_id}"
-        response = requests.get(url, headers=self.headers)
+        response = self._request("GET", url, RETRY_GET_STATUSES)
+        return _loads(response.content).get("data", {})
+
+    def _request(self, method: str, url: str, retry_statuses: Set[int], **kwargs) -> requests.Response:
+        """Send a rate-limited request, retrying `retry_statuses` with backoff."""
+        for attempt in range(MAX_RETRIES + 1):
+            self._wait_for_slot()
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            if response.status_code not in retry_statuses or attempt == MAX_RETRIES:
+                break
+            time.sleep(_retry_delay(response, attempt))
+        
         response.raise_for_status()
-        return response.json().get("data", {})
+        return response
+
+    def _iter_pages(self, url: str, page_size: int) -> Iterator[Dict[str, Any]]:
+        """Yield each page of a paginated listing until an empty or last page."""
+        page = 1
+        while True:
+            response = self._request("GET", url, RETRY_GET_STATUSES, params={"limit": page_size, "page": page})
+            body = _loads(response.content)
+            if not body.get("data"):
+                return
+            yield body
+            
+            # The API may return fewer rows than asked for, so only trust its own page count
+            total_pages = body.get("meta", {}).get("pagination", {}).get("total_pages")
+            if total_pages is not None and page >= total_pages:
+                return
+            page += 1
+
+    def get_existing_codes(self, promotion_id: int, page_size: int = 250,
+                           max_pages: Optional[int] = None) -> Optional[Set[str]]:
+        """Get all coupon codes already on a promotion, upper-cased for comparison.
+        
+        Returns None, without fetching more than `max_pages` pages, if the
+        codes may span more pages than that.
+        """
+        url = f"{self.base_url}/promotions/{promotion_id}/codes"
+        existing = set()
+        for number, body in enumerate(self._iter_pages(url, page_size), start=1):
+            total_pages = body.get("meta", {}).get("pagination", {}).get("total_pages")
+            if max_pages is not None and (total_pages or 0) > max_pages:
+                return None
+            existing.update(coupon["code"].upper() for coupon in body["data"])
+            
+            # Without a reported page count, stop before requesting a page past the cap
+            if max_pages is not None and number >= max_pages and number != total_pages:
+                return None
+        return existing
 
-    def create_coupon_codes(self, promotion_id: int, codes: List[Dict[str, Any]]):
+    def _wait_for_slot(self):
+        """Block until the rate limiter allows another request."""
+        with self._slot_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self._min_interval
+        
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def create_coupon_codes(self, promotion_id: int, codes: List[Dict[str, Any]], show_progress: bool = False):
+        """Create many coupon codes in parallel, returning (success, errors).
+        
+        The API has no batch form for supplied codes, so each code is its
+        own POST; throughput comes from running them concurrently.
+        """
         success = []
         errors = []
+        
+        # tqdm throttles its own redraws, so updating per code stays cheap
+        progress = None
+        if show_progress and tqdm is not None:
+            progress = tqdm(total=len(codes), unit="code")
 
-        for row in codes: 
-            try:
-                self.create_coupon_code(promotion_id, row)
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 422:
-                    errors.append({"message" : "Duplicate code.", "code": row['code']})
-                elif e.response.status_code == 400:
-                    errors.append({"message" : "Error importing code.", "code": row['code']})
-                elif e.response.status_code == 401:
-                    errors.append({"message" : "Error importing code.", "code": row['code']})
-            except Exception as e:
-                errors.append({"message" : "Error importing code.", "code": row['code']})
-            else:
-                success.append({"code": row['code']})
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                futures = {
+                    executor.submit(self.create_coupon_code, promotion_id, row): (index, row)
+                    for index, row in enumerate(codes)
+                }
+                try:
+                    for future in as_completed(futures):
+                        index, row = futures[future]
+                        if progress is not None:
+                            progress.update(1)
+                        try:
+                            future.result()
+                        except requests.exceptions.HTTPError as e:
+                            if e.response.status_code == 422:
+                                errors.append((index, {"message" : "Duplicate code.", "code": row['code']}))
+                            elif e.response.status_code == 400:
+                                errors.append((index, {"message" : "Error importing code.", "code": row['code']}))
+                            elif e.response.status_code == 401:
+                                errors.append((index, {"message" : "Error importing code.", "code": row['code']}))
+                            elif e.response.status_code == 429:
+                                errors.append((index, {"message" : "Rate limited (gave up).", "code": row['code']}))
+                            else:
+                                errors.append((index, {"message" : "Error importing code.", "code": row['code']}))
+                        except Exception as e:
+                            errors.append((index, {"message" : "Error importing code.", "code": row['code']}))
+                        else:
+                            success.append((index, {"code": row['code']}))
+                except BaseException:
+                    # Drop queued uploads so Ctrl+C only waits for in-flight requests
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            if progress is not None:
+                progress.close()
+        
+        # Report results in file order rather than completion order
+        success = [result for _, result in sorted(success, key=itemgetter(0))]
+        errors = [error for _, error in sorted(errors, key=itemgetter(0))]
         
         return (success, errors)
     
     def create_coupon_code(self, promotion_id: int, code_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Create coupon codes for a specific promotion."""
-        url = f"{self.base_url}/promotions/{promotion_id}/codes"
+        """Create a single coupon code for a specific promotion.
         
-        # Format codes for API
-        coupon_data = {
-            "code": code_data["code"],
-            "max_uses": code_data["max_uses"],
-            "max_uses_per_customer": code_data["max_uses_per_customer"]
-        }
-        
-        response = requests.post(url, headers=self.headers, json=coupon_data)
-        response.raise_for_status()
-        return response.json()
+        The codes endpoint accepts one code per request; bulk uploads go
+        through create_coupon_codes, which runs these calls in parallel.
+        `code_data` is sent as-is, so it must only hold API fields, as the
+        rows yielded by iter_coupon_codes do.
+        """
+        url = f"{self.base_url}/promotions/{promotion_id}/codes"
+        response = self._request("POST", url, RETRY_POST_STATUSES, data=_dumps(code_data))
+        return _loads(response.content)
 
 
-def read_coupon_codes(file_path: str, limit: int = 100) -> List[Dict[str, Any]]:
-    """Read coupon codes from a CSV file with Code, MaxUses, MaxUsesPerCustomer columns."""
+def iter_coupon_codes(file_path: str, limit: int = 100) -> Iterator[Dict[str, Any]]:
+    """Lazily yield up to `limit` coupon codes from a CSV file with Code, MaxUses, MaxUsesPerCustomer columns."""
     try:
-        codes = []
         with open(file_path, 'r', encoding='utf-8') as file:
-            # Check if file is empty
-            first_char = file.read(1)
-            if not first_char:
+            csv_reader = csv.reader(file)
+            fieldnames = next(csv_reader, None)
+            
+            # No header row means the file is empty
+            if fieldnames is None:
                 print("Error: CSV file is empty.")
                 sys.exit(1)
-            file.seek(0)  # Reset file pointer
-            
-            csv_reader = csv.DictReader(file)
             
             # Validate required columns
             required_columns = {'Code', 'MaxUses', 'MaxUsesPerCustomer'}
-            if not required_columns.issubset(csv_reader.fieldnames or []):
+            if not required_columns.issubset(fieldnames):
                 print(f"Error: CSV file must contain columns: {', '.join(required_columns)}")
-                print(f"Found columns: {', '.join(csv_reader.fieldnames or [])}")
+                print(f"Found columns: {', '.join(fieldnames)}")
                 sys.exit(1)
             
-            row_number = 1  # Start at 1 since we have headers
+            # Look columns up by position so no per-row dict has to be built
+            code_index = fieldnames.index('Code')
+            max_uses_index = fieldnames.index('MaxUses')
+            max_uses_per_customer_index = fieldnames.index('MaxUsesPerCustomer')
+            width = len(fieldnames)
+            
+            # Coupon codes are case-insensitive in BigCommerce
+            seen = set()
+            yielded = 0
             for row in csv_reader:
-                row_number += 1
-                
                 # Skip empty rows
-                if not any(row.values()):
+                if not any(row):
                     continue
                 
-                code = row['Code'].strip()
+                # Stop parsing as soon as there is a row beyond the cap
+                if yielded >= limit:
+                    print(f"Warning: Stopped reading after {limit} codes (--max-codes); remaining rows were not checked.")
+                    break
+                
+                row_number = csv_reader.line_num
+                if len(row) < width:
+                    row += [''] * (width - len(row))
+                
+                code = row[code_index].strip()
                 if not code:
                     print(f"Warning: Empty code found at row {row_number}, skipping.")
                     continue
@@ -118,37 +288,37 @@ def read_coupon_codes(file_path: str, limit: int = 100) -> List[Dict[str, Any]]:
                     max_uses = 0 # Default is 0 which means unlimited
                     max_uses_per_customer = 0 # Default is 0 which means unlimited
                     
-                    if row['MaxUses'].strip():
-                        max_uses = int(row['MaxUses'].strip())
+                    value = row[max_uses_index].strip()
+                    if value:
+                        max_uses = int(value)
                         if max_uses < 0:
                             print(f"Warning: Invalid MaxUses value at row {row_number} (must be >= 0), skipping.")
                             continue
                     
-                    if row['MaxUsesPerCustomer'].strip():
-                        max_uses_per_customer = int(row['MaxUsesPerCustomer'].strip())
+                    value = row[max_uses_per_customer_index].strip()
+                    if value:
+                        max_uses_per_customer = int(value)
                         if max_uses_per_customer < 0:
                             print(f"Warning: Invalid MaxUsesPerCustomer value at row {row_number} (must be >= 0), skipping.")
                             continue
                     
-                    codes.append({
-                        'code': code,
-                        'max_uses': max_uses,
-                        'max_uses_per_customer': max_uses_per_customer
-                    })
-                
                 except ValueError as e:
                     print(f"Warning: Invalid number format at row {row_number}, skipping. Error: {e}")
                     continue
-        
-        if not codes:
-            print("No valid coupon codes found in CSV file.")
-            sys.exit(1)
-        
-        if len(codes) > limit:
-            print(f"Warning: File contains {len(codes)} codes. Only first {limit} will be uploaded.")
-            codes = codes[:limit]
-        
-        return codes
+                
+                key = code.upper()
+                if key in seen:
+                    print(f"Warning: Duplicate code '{code}' in file at row {row_number}, skipping.")
+                    continue
+                seen.add(key)
+                
+                # Keys match the API's coupon code fields
+                yield {
+                    'code': code,
+                    'max_uses': max_uses,
+                    'max_uses_per_customer': max_uses_per_customer
+                }
+                yielded += 1
     
     except FileNotFoundError:
         print(f"Error: File '{file_path}' not found.")
@@ -191,23 +361,26 @@ def validate_promotion(api: BigCommerceAPI, promotion_id: int) -> bool:
 def list_promotions(api: BigCommerceAPI):
     """List all available promotions."""
     try:
-        promotions = api.get_promotions()
+        # Build the table first and write it in one go rather than line by line
+        lines = [
+            "\nAvailable Promotions:",
+            "-" * 80,
+            f"{'ID':<8} {'Name':<30} {'Type':<15}",
+            "-" * 80
+        ]
+        header_length = len(lines)
         
-        if not promotions:
+        for promo in api.iter_promotions():
+            lines.append(f"{promo.get('id', 'N/A'):<8} "
+                         f"{promo.get('name', 'N/A')[:29]:<30} "
+                         f"{promo.get('redemption_type', 'N/A'):<15}")
+        
+        if len(lines) == header_length:
             print("No promotions found in your store.")
             return
         
-        print("\nAvailable Promotions:")
-        print("-" * 80)
-        print(f"{'ID':<8} {'Name':<30} {'Type':<15}")
-        print("-" * 80)
-        
-        for promo in promotions:
-            print(f"{promo.get('id', 'N/A'):<8} "
-                  f"{promo.get('name', 'N/A')[:29]:<30} "
-                  f"{promo.get('redemption_type', 'N/A'):<15}")
-        
-        print("-" * 80)
+        lines.append("-" * 80)
+        print("\n".join(lines))
 
     except Exception as e:
         print(f"Error listing promotions: {e}")
@@ -266,10 +439,38 @@ File format:
         help="Maximum number of codes to upload (default: 100)"
     )
     
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Number of codes to upload in parallel (default: 8)"
+    )
+    
+    parser.add_argument(
+        "--rps",
+        type=float,
+        default=10.0,
+        help="Maximum API requests per second, retries included (default: 10)"
+    )
+    
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Hide the upload progress bar"
+    )
+    
     args = parser.parse_args()
     
+    if args.concurrency < 1:
+        print("Error: --concurrency must be at least 1.")
+        sys.exit(1)
+    
+    if args.rps <= 0:
+        print("Error: --rps must be greater than 0.")
+        sys.exit(1)
+    
     # Initialize API client
-    api = BigCommerceAPI(args.store_hash, args.token)
+    api = BigCommerceAPI(args.store_hash, args.token, args.concurrency, rps=args.rps)
     
     # List promotions if requested
     if args.list_promotions:
@@ -282,22 +483,37 @@ File format:
         print("Use --list-promotions to see available promotions.")
         sys.exit(1)
     
-    # Validate file exists
-    if not Path(args.file).exists():
-        print(f"Error: File '{args.file}' not found.")
+    # Read coupon codes first so a bad file fails before any API call
+    print(f"Reading coupon codes from '{args.file}'...")
+    codes = list(iter_coupon_codes(args.file, args.max_codes))
+    
+    if not codes:
+        print("No valid coupon codes found in file.")
         sys.exit(1)
     
     # Validate promotion
     if not validate_promotion(api, args.promotion_id):
         sys.exit(1)
     
-    # Read coupon codes
-    print(f"Reading coupon codes from '{args.file}'...")
-    codes = read_coupon_codes(args.file, args.max_codes)
-    
-    if not codes:
-        print("No valid coupon codes found in file.")
-        sys.exit(1)
+    # Skip codes the promotion already has instead of letting them fail with 422,
+    # as long as that takes fewer GETs than the POSTs it could save
+    try:
+        existing = api.get_existing_codes(args.promotion_id, max_pages=len(codes))
+    except Exception as e:
+        print(f"Warning: Could not fetch existing codes, uploading all codes. Error: {e}")
+    else:
+        if existing is None:
+            print("Promotion has too many codes to check up front; existing codes will be reported as duplicates.")
+            existing = set()
+        
+        new_codes = [c for c in codes if c['code'].upper() not in existing]
+        if len(new_codes) < len(codes):
+            print(f"Skipping {len(codes) - len(new_codes)} codes that already exist on the promotion.")
+        codes = new_codes
+        
+        if not codes:
+            print("All coupon codes in file already exist on the promotion.")
+            sys.exit(0)
     
     print(f"Found {len(codes)} coupon codes to upload.")
     
@@ -310,23 +526,22 @@ File format:
     # Upload codes
     try:
         print("Uploading coupon codes...")
-        (created_codes, errors) = api.create_coupon_codes(args.promotion_id, codes)
+        (created_codes, errors) = api.create_coupon_codes(args.promotion_id, codes, show_progress=not args.quiet)
          
         print(f"\nUpload complete!")
         print(f"Successfully created: {len(created_codes)} codes")
         
         if errors:
-            print("-" * 80)
-            print(f"{'Code':<32} {'Message':<128}")
-            print("-" * 80)
+            lines = [
+                "-" * 80,
+                f"{'Code':<32} {'Message':<128}",
+                "-" * 80
+            ]
             for error in errors[:5]:  # Show first 5 errors
-                print(RED
-                      + f"{error.get('code'):<32} "
-                      + f"{error.get('message')[:128]:<128}"
-                      + RESET
-                )
+                lines.append(ERROR_ROW(code=error.get('code'), message=error.get('message')[:128]))
             if len(errors) > 5:
-                print(f"  ... and {len(errors) - 5} more errors")
+                lines.append(f"  ... and {len(errors) - 5} more errors")
+            print("\n".join(lines))
     except Exception as e:
         print(f"Error uploading codes: {e}")
         sys.exit(1)
@@ -0,0 +1,300 @@
+"""Tests for bc_coupon_importer with the HTTP session mocked out."""
+
+import json
+import sys
+
+import pytest
+
+import bc_coupon_importer as importer
+
+
+class FakeResponse:
+    """Minimal stand-in for requests.Response."""
+
+    def __init__(self, status_code=200, body=None, headers=None):
+        self.status_code = status_code
+        self.content = json.dumps(body if body is not None else {}).encode("utf-8")
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise importer.requests.exceptions.HTTPError(response=self)
+
+
+def make_api(**kwargs):
+    kwargs.setdefault("rps", 1000)
+    return importer.BigCommerceAPI("abc123", "token", **kwargs)
+
+
+def mock_requests(monkeypatch, api, handler):
+    """Route session requests to handler(method, params, body) and record each call."""
+    calls = []
+
+    def request(method, url, timeout, params=None, data=None):
+        body = json.loads(data) if data else None
+        calls.append((method, params, body))
+        return handler(method, params, body)
+
+    monkeypatch.setattr(api.session, "request", request)
+    return calls
+
+
+def paged(pages):
+    """Handler serving `pages` by page number, then empty pages."""
+    def handler(method, params, body):
+        page = params["page"]
+        return FakeResponse(body={"data": pages[page - 1] if page <= len(pages) else []})
+    return handler
+
+
+def write_csv(tmp_path, text):
+    path = tmp_path / "codes.csv"
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    """Record sleeps instead of waiting."""
+    sleeps = []
+    monkeypatch.setattr(importer.time, "sleep", sleeps.append)
+    return sleeps
+
+
+# Concurrent uploads
+
+def test_create_coupon_codes_reports_results_in_input_order(monkeypatch, no_sleep):
+    api = make_api(concurrency=4)
+    statuses = {"DUP": 422, "BAD": 400}
+    mock_requests(monkeypatch, api,
+                  lambda method, params, body: FakeResponse(statuses.get(body["code"], 200)))
+    codes = [{"code": code} for code in ["BAD", "A", "DUP", "B", "C"]]
+
+    success, errors = api.create_coupon_codes(1, codes)
+
+    assert success == [{"code": "A"}, {"code": "B"}, {"code": "C"}]
+    assert errors == [
+        {"message": "Error importing code.", "code": "BAD"},
+        {"message": "Duplicate code.", "code": "DUP"},
+    ]
+
+
+# Retries
+
+def test_create_coupon_codes_reports_rate_limited_codes(monkeypatch, no_sleep):
+    api = make_api()
+    mock_requests(monkeypatch, api, lambda method, params, body: FakeResponse(429))
+
+    success, errors = api.create_coupon_codes(1, [{"code": "A"}])
+
+    assert success == []
+    assert errors == [{"message": "Rate limited (gave up).", "code": "A"}]
+
+
+def test_create_coupon_code_retries_429_and_503(monkeypatch, no_sleep):
+    api = make_api()
+    responses = [FakeResponse(429, headers={"Retry-After": "2"}), FakeResponse(503), FakeResponse(200)]
+    mock_requests(monkeypatch, api, lambda method, params, body: responses.pop(0))
+
+    api.create_coupon_code(1, {"code": "A"})
+
+    assert not responses
+    assert no_sleep[0] == 2.0
+
+
+def test_create_coupon_code_gives_up_after_max_retries(monkeypatch, no_sleep):
+    api = make_api()
+    calls = mock_requests(monkeypatch, api, lambda method, params, body: FakeResponse(429))
+
+    with pytest.raises(importer.requests.exceptions.HTTPError):
+        api.create_coupon_code(1, {"code": "A"})
+    assert len(calls) == importer.MAX_RETRIES + 1
+
+
+def test_create_coupon_code_does_not_resend_after_server_error(monkeypatch, no_sleep):
+    api = make_api()
+    calls = mock_requests(monkeypatch, api, lambda method, params, body: FakeResponse(500))
+
+    with pytest.raises(importer.requests.exceptions.HTTPError):
+        api.create_coupon_code(1, {"code": "A"})
+    assert len(calls) == 1
+
+
+def test_get_requests_retry_server_errors(monkeypatch, no_sleep):
+    api = make_api()
+    responses = [FakeResponse(500), FakeResponse(200, body={"data": {"id": 1}})]
+    mock_requests(monkeypatch, api, lambda method, params, body: responses.pop(0))
+
+    assert api.get_promotion_by_id(1) == {"id": 1}
+
+
+def test_session_only_retries_failed_connections():
+    retry = make_api().session.get_adapter("https://api.bigcommerce.com").max_retries
+
+    assert retry.read == 0
+    assert not retry.status_forcelist
+
+
+# Rate limiting
+
+def test_wait_for_slot_spaces_requests(monkeypatch, no_sleep):
+    api = make_api(rps=4)
+    monkeypatch.setattr(importer.time, "monotonic", lambda: 100.0)
+    api._next_slot = 100.0
+
+    for _ in range(3):
+        api._wait_for_slot()
+
+    assert no_sleep == [0.25, 0.5]
+
+
+def test_every_request_and_retry_takes_a_slot(monkeypatch, no_sleep):
+    api = make_api()
+    slots = []
+    monkeypatch.setattr(api, "_wait_for_slot", lambda: slots.append(1))
+    responses = [FakeResponse(200, body={"data": {}}), FakeResponse(503), FakeResponse(200)]
+    mock_requests(monkeypatch, api, lambda method, params, body: responses.pop(0))
+
+    api.get_promotion_by_id(1)
+    api.create_coupon_code(1, {"code": "A"})
+
+    assert len(slots) == 3
+
+
+# CSV reading
+
+def test_iter_coupon_codes_parses_rows(tmp_path):
+    path = write_csv(tmp_path, "MaxUsesPerCustomer,Code,MaxUses\n1, SAVE10 ,5\n,FREE,\n")
+
+    assert list(importer.iter_coupon_codes(path)) == [
+        {"code": "SAVE10", "max_uses": 5, "max_uses_per_customer": 1},
+        {"code": "FREE", "max_uses": 0, "max_uses_per_customer": 0},
+    ]
+
+
+def test_iter_coupon_codes_pads_short_rows(tmp_path):
+    path = write_csv(tmp_path, "Code,MaxUses,MaxUsesPerCustomer\nSHORT,3\n")
+
+    assert list(importer.iter_coupon_codes(path)) == [
+        {"code": "SHORT", "max_uses": 3, "max_uses_per_customer": 0},
+    ]
+
+
+def test_iter_coupon_codes_reports_file_line_numbers(tmp_path, capsys):
+    path = write_csv(tmp_path, "Code,MaxUses,MaxUsesPerCustomer\n\nA,-1,1\nB,x,1\n")
+
+    assert list(importer.iter_coupon_codes(path)) == []
+    out = capsys.readouterr().out
+    assert "Invalid MaxUses value at row 3" in out
+    assert "Invalid number format at row 4" in out
+
+
+def test_iter_coupon_codes_stops_at_limit(tmp_path, capsys):
+    path = write_csv(tmp_path, "Code,MaxUses,MaxUsesPerCustomer\nA,1,1\nB,1,1\nC,1,1\n")
+
+    codes = list(importer.iter_coupon_codes(path, limit=2))
+
+    assert [c["code"] for c in codes] == ["A", "B"]
+    assert "Stopped reading after 2 codes" in capsys.readouterr().out
+
+
+def test_iter_coupon_codes_no_warning_at_exact_limit(tmp_path, capsys):
+    path = write_csv(tmp_path, "Code,MaxUses,MaxUsesPerCustomer\nA,1,1\nB,1,1\n\n")
+
+    assert len(list(importer.iter_coupon_codes(path, limit=2))) == 2
+    assert "Stopped reading" not in capsys.readouterr().out
+
+
+def test_iter_coupon_codes_skips_duplicates_case_insensitively(tmp_path, capsys):
+    path = write_csv(tmp_path, "Code,MaxUses,MaxUsesPerCustomer\nSave,1,1\nSAVE,1,1\nOther,1,1\n")
+
+    codes = list(importer.iter_coupon_codes(path))
+
+    assert [c["code"] for c in codes] == ["Save", "Other"]
+    assert "Duplicate code 'SAVE' in file at row 3" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("text, message", [
+    ("", "CSV file is empty"),
+    ("Code,MaxUses\nA,1\n", "CSV file must contain columns"),
+])
+def test_iter_coupon_codes_rejects_bad_files(tmp_path, capsys, text, message):
+    path = write_csv(tmp_path, text)
+
+    with pytest.raises(SystemExit):
+        list(importer.iter_coupon_codes(path))
+    assert message in capsys.readouterr().out
+
+
+def test_iter_coupon_codes_missing_file(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        list(importer.iter_coupon_codes(str(tmp_path / "missing.csv")))
+    assert "not found" in capsys.readouterr().out
+
+
+def test_main_reports_missing_file_before_calling_the_api(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", [
+        "bc_coupon_importer.py", "--store-hash", "abc123", "--token", "token",
+        "--promotion-id", "1", "--file", str(tmp_path / "missing.csv"),
+    ])
+    monkeypatch.setattr(importer.BigCommerceAPI, "_request",
+                        lambda *args, **kwargs: pytest.fail("API called before reading the file"))
+
+    with pytest.raises(SystemExit):
+        importer.main()
+    assert "not found" in capsys.readouterr().out
+
+
+# Existing codes
+
+def test_get_existing_codes_upper_cases_all_pages(monkeypatch):
+    api = make_api()
+    mock_requests(monkeypatch, api, paged([[{"code": "abc"}], [{"code": "Def"}]]))
+
+    assert api.get_existing_codes(1) == {"ABC", "DEF"}
+
+
+def test_get_existing_codes_gives_up_past_max_pages(monkeypatch):
+    api = make_api()
+    meta = {"pagination": {"total_pages": 40}}
+    calls = mock_requests(monkeypatch, api,
+                          lambda method, params, body: FakeResponse(body={"data": [{"code": "X"}], "meta": meta}))
+
+    assert api.get_existing_codes(1, max_pages=5) is None
+    assert len(calls) == 1
+
+
+def test_get_existing_codes_without_meta_stops_at_max_pages(monkeypatch):
+    api = make_api()
+    calls = mock_requests(monkeypatch, api,
+                          lambda method, params, body: FakeResponse(body={"data": [{"code": f"X{params['page']}"}]}))
+
+    assert api.get_existing_codes(1, max_pages=3) is None
+    assert [params["page"] for _, params, _ in calls] == [1, 2, 3]
+
+
+def test_get_existing_codes_within_max_pages(monkeypatch):
+    api = make_api()
+    mock_requests(monkeypatch, api, paged([[{"code": "A"}], [{"code": "B"}]]))
+
+    assert api.get_existing_codes(1, max_pages=3) == {"A", "B"}
+
+
+# Promotions
+
+def test_iter_promotions_continues_past_short_pages(monkeypatch):
+    api = make_api()
+    calls = mock_requests(monkeypatch, api, paged([[{"id": 1}, {"id": 2}], [{"id": 3}]]))
+
+    assert [p["id"] for p in api.iter_promotions(page_size=100)] == [1, 2, 3]
+    assert [params["page"] for _, params, _ in calls] == [1, 2, 3]
+
+
+def test_iter_promotions_stops_at_last_reported_page(monkeypatch):
+    api = make_api()
+    meta = {"pagination": {"total_pages": 2}}
+    calls = mock_requests(monkeypatch, api,
+                          lambda method, params, body: FakeResponse(body={"data": [{"id": params["page"]}], "meta": meta}))
+
+    assert [p["id"] for p in api.iter_promotions()] == [1, 2]
+    assert len(calls) == 2